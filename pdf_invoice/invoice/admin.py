@@ -1,24 +1,111 @@
 from django.contrib import admin
-from .models import Order, UserProfile, Items
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum
+from django.utils.functional import cached_property
+from .models import Order, UserProfile, Items, TaskOutcome, Artifact
 
 
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ['user', 'created_at']
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that reads the row count of large, unfiltered PostgreSQL
+    tables from the planner statistics instead of running COUNT(*).
+    """
+    # Below this many rows an exact count is cheap enough
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql' or query.where:
+            return super().count
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+                [query.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < self.estimate_threshold:
+            return super().count
+        return int(row[0])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin for tables with millions of rows.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class OrderAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'created_at', 'item_count', 'total']
     list_filter = ['created_at']
-    search_fields = ['user']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
+    # Prefix and exact lookups can use the username and email indexes
+    search_fields = ['user__username__startswith', 'user__email__exact']
+    search_help_text = "Username prefix or exact email"
+
+    def get_queryset(self, request):
+        # Correlated subqueries only run for the rows of the current page,
+        # unlike a GROUP BY over every order.
+        items = Items.objects.filter(order=OuterRef('pk')).values('order')
+        return super().get_queryset(request).annotate(
+            item_count=Subquery(
+                items.annotate(count=Count('id')).values('count')
+                ),
+            total=Subquery(
+                items.annotate(
+                    total=Sum(F('quantity') * F('price'))
+                    ).values('total'),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ),
+        )
 
+    @admin.display(description='Items', ordering='item_count')
+    def item_count(self, obj):
+        return obj.item_count or 0
 
-class ItemsAdmin(admin.ModelAdmin):
+    @admin.display(description='Total', ordering='total')
+    def total(self, obj):
+        return obj.total or 0
+
+
+class ItemsAdmin(LargeTableAdmin):
     list_display = ['order', 'item_name', 'quantity', 'price']
-    list_filter = ['item_name', 'price']
+    list_select_related = ['order__user']
+    raw_id_fields = ['order']
     search_fields = ['item_name']
 
 
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(LargeTableAdmin):
     list_display = ['user', 'image']
-    search_fields = ['user']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
+    search_fields = ['user__username__startswith', 'user__email__exact']
+    search_help_text = "Username prefix or exact email"
+
+
+class TaskOutcomeAdmin(admin.ModelAdmin):
+    list_display = ['task_name', 'status', 'day', 'count']
+    list_filter = ['status', 'day']
+    search_fields = ['task_name']
+
+
+class ArtifactAdmin(LargeTableAdmin):
+    list_display = ['path', 'kind', 'order', 'size', 'archive', 'created_at']
+    list_filter = ['kind', 'created_at']
+    list_select_related = ['order__user']
+    search_fields = ['path']
+    raw_id_fields = ['order']
 
 
 admin.site.register(Order, OrderAdmin)
 admin.site.register(UserProfile, UserProfileAdmin)
 admin.site.register(Items, ItemsAdmin)
+admin.site.register(TaskOutcome, TaskOutcomeAdmin)
+admin.site.register(Artifact, ArtifactAdmin)
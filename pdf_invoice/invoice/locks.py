@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import TaskLock
+
+
+def acquire_lock(name, ttl):
+    """
+    Takes a named lock unless another holder's lock is still valid.
+
+    Args:
+    name: The lock name, e.g. the task name.
+    ttl: timedelta after which the lock expires if never released.
+
+    Returns:
+    datetime: The expiry of the acquired lock, or None if it is held.
+    """
+    now = timezone.now()
+    locked_until = now + ttl
+    taken = TaskLock.objects.filter(
+        name=name, locked_until__lte=now
+        ).update(locked_until=locked_until)
+    if taken:
+        return locked_until
+    try:
+        with transaction.atomic():
+            TaskLock.objects.create(name=name, locked_until=locked_until)
+    except IntegrityError:
+        return None
+    return locked_until
+
+
+def release_lock(name, locked_until):
+    """
+    Releases a lock, unless it expired and was taken by someone else.
+    """
+    TaskLock.objects.filter(
+        name=name, locked_until=locked_until
+        ).update(locked_until=timezone.now())
+
+
+@contextmanager
+def single_flight(name, ttl):
+    """
+    Holds a named lock for the duration of the block.
+
+    Yields:
+    bool: Whether the lock was acquired; the block should do nothing
+    if it wasn't.
+    """
+    locked_until = acquire_lock(name, ttl)
+    try:
+        yield locked_until is not None
+    finally:
+        if locked_until is not None:
+            release_lock(name, locked_until)
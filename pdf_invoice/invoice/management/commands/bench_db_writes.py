@@ -0,0 +1,135 @@
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from statistics import median, quantiles
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+
+def _init_worker():
+    """
+    Prepares a benchmark worker process with its own database connection.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pdf_invoice.settings')
+    django.setup()
+    # Never reuse a connection inherited from the parent process.
+    connections.close_all()
+
+
+def _write_orders(run_id, worker_id, user_id, orders, items_per_order):
+    """
+    Writes orders, their items and a task result row for each order.
+
+    Args:
+    run_id: Identifier shared by every row of this benchmark run.
+    worker_id: Index of the worker process.
+    user_id: The ID of the user the orders belong to.
+    orders: Number of orders to write.
+    items_per_order: Number of items written with each order.
+
+    Returns:
+    tuple: Per-order write latencies and the number of failed writes.
+    """
+    from django.db import OperationalError, transaction
+    from django_celery_results.models import TaskResult
+    from invoice.models import Items, Order
+
+    latencies = []
+    errors = 0
+    for i in range(orders):
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(user_id=user_id)
+                # bulk_create skips post_save, so no invoice task is queued
+                Items.objects.bulk_create(
+                    Items(
+                        order=order,
+                        item_name=f"Bench item {n}",
+                        quantity=1,
+                        price=Decimal("9.99")
+                    )
+                    for n in range(items_per_order)
+                )
+            TaskResult.objects.create(
+                task_id=f"bench-{run_id}-{worker_id}-{i}",
+                task_name='invoice.tasks.generate_and_send_invoices',
+                status='SUCCESS'
+            )
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks concurrent order and task result writes from many "
+        "worker processes against the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=200,
+                            help="Orders written by each worker.")
+        parser.add_argument('--items', type=int, default=3,
+                            help="Items written with each order.")
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep the benchmark rows afterwards.")
+
+    def handle(self, *args, **options):
+        from django_celery_results.models import TaskResult
+
+        run_id = uuid.uuid4().hex[:8]
+        # bulk_create skips post_save, so no welcome email is queued
+        user, = User.objects.bulk_create([
+            User(
+                username=f"bench-{run_id}",
+                email=f"bench-{run_id}@example.com"
+            )
+        ])
+        workers = options['workers']
+        connections.close_all()
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+            futures = [
+                pool.submit(
+                    _write_orders, run_id, worker_id, user.id,
+                    options['orders'], options['items']
+                    )
+                for worker_id in range(workers)
+            ]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(
+            latency for worker, _ in results for latency in worker
+            )
+        errors = sum(errors for _, errors in results)
+
+        self.stdout.write(
+            f"{connection.vendor}: {workers} workers, "
+            f"{len(latencies)} orders in {elapsed:.2f}s "
+            f"({len(latencies) / elapsed:.1f} orders/s), {errors} failed"
+        )
+        if len(latencies) > 1:
+            p95 = quantiles(latencies, n=20)[-1]
+            self.stdout.write(
+                f"write latency p50 {median(latencies) * 1000:.1f}ms "
+                f"p95 {p95 * 1000:.1f}ms max {latencies[-1] * 1000:.1f}ms"
+            )
+
+        if not options['keep']:
+            TaskResult.objects.filter(
+                task_id__startswith=f"bench-{run_id}-"
+                ).delete()
+            # Deleting the user cascades to its orders and items.
+            user.delete()
@@ -0,0 +1,64 @@
+import re
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.rendering import RENDERERS
+
+PAGE_OBJECT = re.compile(rb'/Type /Page\b(?!s)')
+
+
+def _invoice(items):
+    """
+    Builds synthetic invoice data with the given number of items.
+    """
+    rows = []
+    for n in range(items):
+        quantity = n % 5 + 1
+        price = Decimal(100 + n % 900) / 100
+        rows.append((f"Product {n}", quantity, price, price * quantity))
+    return {
+        'order_id': items,
+        'customer': 'benchmark',
+        'items': rows,
+        'total': sum(total for *_, total in rows),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares per-document and per-page render time of the invoice "
+        "renderers for small and large orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', default='5,500',
+                            help="Comma separated item counts per order.")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['items'].split(',')]
+        except ValueError:
+            raise CommandError("--items must be comma separated integers")
+
+        for size in sizes:
+            data = _invoice(size)
+            results = {}
+            for name, render in RENDERERS.items():
+                render(data)  # warm up font and module caches
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    pdf = render(data)
+                elapsed = (time.perf_counter() - start) / options['repeat']
+                results[name] = (elapsed, len(PAGE_OBJECT.findall(pdf)))
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{size} items"))
+            for name, (elapsed, pages) in results.items():
+                self.stdout.write(
+                    f"  {name:9} {elapsed * 1000:8.2f}ms/doc "
+                    f"{elapsed / pages * 1000:8.2f}ms/page ({pages} pages)"
+                )
+            platypus, canvas = results['platypus'][0], results['canvas'][0]
+            self.stdout.write(f"  canvas speedup {platypus / canvas:.1f}x")
@@ -0,0 +1,105 @@
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import Counter
+from statistics import median
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Each target is run in a fresh interpreter, as its process would start.
+TARGETS = {
+    'manage.py check': ['manage.py', 'check'],
+    'web': ['-c', (
+        "from pdf_invoice.wsgi import application;"
+        "from django.urls import get_resolver;"
+        "get_resolver().url_patterns"
+    )],
+    'worker': ['-c', (
+        "import django;"
+        "from pdf_invoice.celery import app;"
+        "django.setup();"
+        "app.loader.import_default_modules();"
+        "app.finalize()"
+    )],
+}
+
+IMPORTTIME_LINE = re.compile(
+    r'^import time:\s+(\d+) \|\s+\d+ \| *(\S+)$'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures cold start time of manage.py commands, the web process "
+        "and a worker, with an -X importtime breakdown per package."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--top', type=int, default=10,
+                            help="Packages shown per target.")
+        parser.add_argument('--target', action='append',
+                            choices=list(TARGETS),
+                            help="Only benchmark this target.")
+
+    def handle(self, *args, **options):
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ.get(
+                'DJANGO_SETTINGS_MODULE', 'pdf_invoice.settings'
+                )
+        )
+        for name in options['target'] or TARGETS:
+            argv = TARGETS[name]
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                self._run([sys.executable, *argv], env)
+                timings.append(time.perf_counter() - start)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{name}: median {median(timings) * 1000:.0f}ms, "
+                f"min {min(timings) * 1000:.0f}ms "
+                f"over {len(timings)} runs"
+            ))
+
+            stderr = self._run(
+                [sys.executable, '-X', 'importtime', *argv], env
+                )
+            packages = self._import_time_by_package(stderr)
+            total = sum(packages.values())
+            self.stdout.write(f"  imports: {total / 1000:.0f}ms")
+            for package, self_time in packages.most_common(options['top']):
+                self.stdout.write(f"  {self_time / 1000:8.1f}ms  {package}")
+
+    def _run(self, argv, env):
+        """
+        Runs a command from the project directory and returns its stderr.
+        """
+        return subprocess.run(
+            argv,
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=True
+        ).stderr
+
+    def _import_time_by_package(self, stderr):
+        """
+        Sums the self time of -X importtime output per top level package.
+
+        Returns:
+        Counter: Microseconds spent importing each package.
+        """
+        packages = Counter()
+        for line in stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                package = match.group(2).split('.')[0]
+                packages[package] += int(match.group(1))
+        return packages
@@ -0,0 +1,191 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, time as dt_time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from invoice.models import Artifact, Order
+from invoice.rendering import RENDERERS, get_renderer, invoice_data
+from invoice.storage import store_artifact
+from invoice.tasks import send_invoice_email
+
+
+def _parse_date(value, end=False):
+    """
+    Parses a YYYY-MM-DD date into an aware datetime at the day's bounds.
+    """
+    try:
+        day = datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+    return timezone.make_aware(
+        datetime.combine(day, dt_time.max if end else dt_time.min)
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenerates and re-sends invoices for every order in a period. "
+        "PDFs are rendered on all CPU cores and emailed from a separate "
+        "thread pool; progress is checkpointed so a run can be resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First order date, YYYY-MM-DD.")
+        parser.add_argument('--end', help="Last order date, YYYY-MM-DD.")
+        parser.add_argument('--user', action='append', default=[],
+                            help="Only orders of this username.")
+        parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                            help="Render processes, defaults to CPU count.")
+        parser.add_argument('--email-threads', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--template', choices=list(RENDERERS),
+                            help="Invoice renderer, defaults to "
+                                 "INVOICE_TEMPLATE.")
+        parser.add_argument('--no-email', action='store_true',
+                            help="Only regenerate the PDFs.")
+        parser.add_argument('--checkpoint', default='invoice_run.json',
+                            help="File recording the last finished order.")
+        parser.add_argument('--resume', action='store_true',
+                            help="Skip orders finished by a previous run and "
+                                 "retry the ones it failed.")
+
+    def handle(self, *args, **options):
+        orders = Order.objects.select_related('user').prefetch_related(
+            'items'
+            ).order_by('id')
+        if options['start']:
+            orders = orders.filter(
+                created_at__gte=_parse_date(options['start'])
+                )
+        if options['end']:
+            orders = orders.filter(
+                created_at__lte=_parse_date(options['end'], end=True)
+                )
+        if options['user']:
+            orders = orders.filter(user__username__in=options['user'])
+
+        checkpoint = options['checkpoint']
+        self.last_order_id = 0
+        self.retrying = set()
+        if options['resume'] and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = json.load(f)
+            self.last_order_id = state['last_order_id']
+            self.retrying = set(state.get('failed', []))
+            # Orders that failed before the checkpoint are retried too
+            orders = orders.filter(
+                Q(id__gt=self.last_order_id) | Q(id__in=self.retrying)
+                )
+            self.stdout.write(
+                f"Resuming after order #{self.last_order_id}, retrying "
+                f"{len(self.retrying)} failed orders"
+            )
+
+        self.renderer = get_renderer(options['template'])
+        self.processed = 0
+        self.failures = []
+        self.started = time.perf_counter()
+
+        # Render processes never touch the database. They are spawned
+        # rather than forked so they don't inherit this process's open
+        # database connections.
+        with ProcessPoolExecutor(
+            options['processes'],
+            mp_context=multiprocessing.get_context('spawn')
+        ) as renderers, \
+                ThreadPoolExecutor(options['email_threads']) as mailers:
+            pending = None
+            for batch in self._batches(orders, options['batch_size']):
+                sent = self._render_batch(
+                    batch, renderers, mailers, options['no_email']
+                    )
+                if pending:
+                    self._finish_batch(*pending, checkpoint)
+                pending = (batch, sent)
+            if pending:
+                self._finish_batch(*pending, checkpoint)
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {self.processed} orders in {elapsed:.1f}s "
+            f"({self.processed / elapsed if elapsed else 0:.1f} orders/s), "
+            f"{len(self.failures)} failed"
+        ))
+        for order_id, error in self.failures:
+            self.stderr.write(f"Order #{order_id}: {error}")
+
+    def _batches(self, orders, batch_size):
+        """
+        Yields lists of orders, keyset paginated on id.
+        """
+        last_id = 0
+        while True:
+            batch = list(orders.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1].id
+
+    def _render_batch(self, batch, renderers, mailers, no_email):
+        """
+        Renders a batch in the process pool, stores the PDFs and queues
+        their emails.
+
+        Returns:
+        list: (order, future) pairs for the queued emails.
+        """
+        rendered = [
+            (order, renderers.submit(self.renderer, invoice_data(order)))
+            for order in batch
+        ]
+        sent = []
+        for order, future in rendered:
+            try:
+                pdf = future.result()
+                filename = f'invoice_{order.id}.pdf'
+                store_artifact(Artifact.INVOICE, filename, pdf, order=order)
+            except Exception as exc:
+                self.failures.append((order.id, f"render failed: {exc}"))
+                continue
+            if not no_email:
+                sent.append((order, mailers.submit(
+                    send_invoice_email, order.user.email, filename, pdf
+                    )))
+        return sent
+
+    def _finish_batch(self, batch, sent, checkpoint):
+        """
+        Waits for a batch's emails, then checkpoints and reports progress.
+        """
+        for order, future in sent:
+            try:
+                future.result()
+            except Exception as exc:
+                self.failures.append((order.id, f"email failed: {exc}"))
+
+        self.processed += len(batch)
+        # Retried orders come before the checkpoint, never move it back
+        self.last_order_id = max(self.last_order_id, batch[-1].id)
+        # Earlier failures not retried yet must survive an interruption
+        self.retrying.difference_update(order.id for order in batch)
+        failed = self.retrying.union(
+            order_id for order_id, _ in self.failures
+            )
+        with open(checkpoint, 'w') as f:
+            json.dump({
+                'last_order_id': self.last_order_id,
+                'processed': self.processed,
+                'failed': sorted(failed),
+            }, f)
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f"{self.processed} orders, {len(self.failures)} failed, "
+            f"{self.processed / elapsed:.1f} orders/s"
+        )
@@ -0,0 +1,345 @@
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from decimal import Decimal
+from statistics import median, quantiles
+
+from celery import current_app
+from celery.signals import task_failure, task_retry, task_success
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import setting_changed
+from django.db.models import Q
+
+from invoice.models import (
+    Artifact, Items, Order, PendingWelcomeEmail, UserProfile
+)
+from invoice.ratelimit import RateLimiter
+from invoice.signals import (
+    task_failure_signal, task_retry_signal, task_success_signal
+)
+
+INVOICE_TASK = 'invoice.tasks.generate_and_send_invoices'
+
+# Receivers counting task outcomes, muted so synthetic traffic doesn't
+# end up in the TaskOutcome aggregates.
+OUTCOME_RECEIVERS = [
+    (task_success, task_success_signal),
+    (task_failure, task_failure_signal),
+    (task_retry, task_retry_signal),
+]
+
+
+def _parse_mix(value):
+    """
+    Parses a traffic mix like "order=6,signup=3,profile=1" into weights.
+    """
+    weights = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in ('order', 'signup', 'profile'):
+            raise CommandError(f"Unknown traffic kind {kind!r}")
+        try:
+            weights[kind] = float(weight)
+        except ValueError:
+            raise CommandError(f"Invalid weight {weight!r} for {kind}")
+    return weights
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays synthetic orders, signups and profile uploads through the "
+        "real models, signals and tasks, and reports end-to-end invoice "
+        "latency, queue depth over time and the saturation point."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--executor', choices=['memory', 'eager'],
+                            default='memory',
+                            help="memory: in-process worker on a memory "
+                                 "broker; eager: run tasks inline.")
+        parser.add_argument('--rates', default='5,10,20,40',
+                            help="Comma separated events/s, one ramp step "
+                                 "each.")
+        parser.add_argument('--duration', type=float, default=10,
+                            help="Seconds per ramp step.")
+        parser.add_argument('--mix', default='order=6,signup=3,profile=1',
+                            help="Relative weights of each traffic kind.")
+        parser.add_argument('--items', type=int, default=3,
+                            help="Items inserted with each order.")
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help="Worker threads of the memory executor.")
+        parser.add_argument('--sample-interval', type=float, default=1.0)
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep generated rows and files.")
+
+    def handle(self, *args, **options):
+        try:
+            rates = [float(rate) for rate in options['rates'].split(',')]
+        except ValueError:
+            raise CommandError("--rates must be comma separated numbers")
+        mix = _parse_mix(options['mix'])
+
+        self.run_id = uuid.uuid4().hex[:8]
+        self.users = 0
+        self.inserted = defaultdict(deque)
+        self.latencies = []
+        self.lock = threading.Lock()
+        media_root = tempfile.mkdtemp(prefix='loadgen-')
+
+        app = current_app
+        with ExitStack() as stack:
+            self._set_setting(stack, 'MEDIA_ROOT', media_root)
+            self._set_setting(
+                stack,
+                'EMAIL_BACKEND',
+                'django.core.mail.backends.locmem.EmailBackend'
+            )
+            for signal, receiver in OUTCOME_RECEIVERS:
+                signal.disconnect(receiver)
+                stack.callback(signal.connect, receiver)
+            task_success.connect(self._on_success)
+            stack.callback(task_success.disconnect, self._on_success)
+            stack.callback(
+                app.conf.update,
+                task_always_eager=app.conf.task_always_eager,
+                broker_transport_options=app.conf.broker_transport_options
+            )
+
+            if options['executor'] == 'eager':
+                app.conf.task_always_eager = True
+            else:
+                from celery.contrib.testing.worker import start_worker
+
+                app.conf.task_always_eager = False
+                # Celery reads CELERY_BROKER_URL from the environment first
+                self._set_environ(stack, 'CELERY_BROKER_URL', 'memory://')
+                # The memory transport polls an empty queue once a second
+                # by default, which would dominate the measured latency.
+                app.conf.broker_transport_options = {'polling_interval': 0.01}
+                stack.enter_context(start_worker(
+                    app,
+                    pool='threads',
+                    concurrency=options['concurrency'],
+                    perform_ping_check=False
+                ))
+
+            steps = [
+                self._run_step(app, rate, mix, options) for rate in rates
+            ]
+            self._drain(app, options['sample_interval'])
+
+        self._report(steps)
+        if not options['keep']:
+            self._cleanup()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def _set_setting(self, stack, name, value):
+        """
+        Sets a Django setting until the stack unwinds.
+
+        setting_changed lets cached users of the setting, such as file
+        storages, pick up the new value.
+        """
+        previous = getattr(settings, name)
+
+        def apply(value, enter):
+            setattr(settings, name, value)
+            setting_changed.send(
+                sender=type(self), setting=name, value=value, enter=enter
+            )
+
+        apply(value, True)
+        stack.callback(apply, previous, False)
+
+    def _set_environ(self, stack, name, value):
+        """
+        Sets an environment variable until the stack unwinds.
+        """
+        previous = os.environ.get(name)
+        os.environ[name] = value
+        if previous is None:
+            stack.callback(os.environ.pop, name, None)
+        else:
+            stack.callback(os.environ.__setitem__, name, previous)
+
+    def _on_success(self, sender=None, **kwargs):
+        """
+        Records the latency of a delivered invoice.
+        """
+        if sender.name != INVOICE_TASK:
+            return
+        order_id = sender.request.args[0]
+        with self.lock:
+            pending = self.inserted.get(order_id)
+            if pending:
+                self.latencies.append(time.perf_counter() - pending.popleft())
+
+    def _outstanding(self):
+        with self.lock:
+            return sum(len(pending) for pending in self.inserted.values())
+
+    def _broker_depth(self, app):
+        if app.conf.task_always_eager:
+            return 0
+        with app.connection_for_write() as conn:
+            return conn.default_channel.queue_declare(
+                app.conf.task_default_queue, passive=True
+            ).message_count
+
+    def _run_step(self, app, rate, mix, options):
+        """
+        Generates traffic at one rate for the step duration.
+
+        Returns:
+        dict: Offered rate, deliveries, latencies and queue samples.
+        """
+        kinds, weights = zip(*mix.items())
+        limiter = RateLimiter(rate)
+        delivered_before = len(self.latencies)
+        samples = []
+        start = time.perf_counter()
+        next_sample = start
+        events = invoices = 0
+
+        while time.perf_counter() - start < options['duration']:
+            limiter.wait()
+            events += 1
+            kind = random.choices(kinds, weights)[0]
+            if kind == 'order':
+                self._order(options['items'])
+                invoices += options['items']
+            elif kind == 'signup':
+                self._signup()
+            else:
+                self._profile()
+
+            now = time.perf_counter()
+            if now >= next_sample:
+                samples.append((
+                    now - start, self._broker_depth(app), self._outstanding()
+                ))
+                next_sample = now + options['sample_interval']
+
+        elapsed = time.perf_counter() - start
+        latencies = self.latencies[delivered_before:]
+        step = {
+            'rate': rate,
+            'event_rate': events / elapsed,
+            'invoice_rate': invoices / elapsed,
+            'delivered_rate': len(latencies) / elapsed,
+            'latencies': latencies,
+            'samples': samples,
+        }
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{rate:g} events/s ({events / elapsed:.1f} achieved): "
+            f"{invoices / elapsed:.1f} invoices/s offered, "
+            f"{step['delivered_rate']:.1f} delivered/s"
+        ))
+        for offset, depth, outstanding in samples:
+            self.stdout.write(
+                f"  t={offset:5.1f}s queue={depth} outstanding={outstanding}"
+            )
+        return step
+
+    def _drain(self, app, interval, timeout=60):
+        """
+        Waits for outstanding invoices to be delivered.
+        """
+        deadline = time.perf_counter() + timeout
+        while self._outstanding() and time.perf_counter() < deadline:
+            time.sleep(interval)
+
+    def _new_user(self):
+        self.users += 1
+        return User.objects.create_user(
+            username=f"loadgen-{self.run_id}-{self.users}",
+            email=f"loadgen-{self.run_id}-{self.users}@example.com"
+        )
+
+    def _order(self, items):
+        order = Order.objects.create(user=self._new_user())
+        for n in range(items):
+            with self.lock:
+                self.inserted[order.id].append(time.perf_counter())
+            Items.objects.create(
+                order=order,
+                item_name=f"Load item {n}",
+                quantity=random.randint(1, 5),
+                price=Decimal(random.randint(100, 10000)) / 100
+            )
+
+    def _signup(self):
+        self._new_user()
+
+    def _profile(self):
+        from PIL import Image
+
+        user = self._new_user()
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), color='blue').save(buffer, 'JPEG')
+        profile = UserProfile(user=user)
+        profile.image.save(f"{user.username}.jpg", buffer, save=False)
+        profile.save()
+
+    def _report(self, steps):
+        """
+        Prints latency per step and the first saturated step.
+        """
+        self.stdout.write(self.style.MIGRATE_HEADING("Summary"))
+        saturation = None
+        for step in steps:
+            latencies = sorted(step['latencies'])
+            if len(latencies) > 1:
+                p95 = quantiles(latencies, n=20)[-1]
+                latency = (
+                    f"p50 {median(latencies) * 1000:.0f}ms "
+                    f"p95 {p95 * 1000:.0f}ms"
+                )
+            else:
+                latency = "no deliveries"
+            depths = [outstanding for *_, outstanding in step['samples']]
+            growing = len(depths) > 1 and depths[-1] > depths[0]
+            self.stdout.write(
+                f"  {step['rate']:g} events/s "
+                f"({step['event_rate']:.1f} achieved): "
+                f"{step['delivered_rate']:.1f}/"
+                f"{step['invoice_rate']:.1f} invoices/s delivered, {latency}"
+            )
+            # Saturated once the backlog keeps growing because deliveries
+            # fall behind the offered invoice rate.
+            if saturation is None and growing and (
+                step['delivered_rate'] < 0.9 * step['invoice_rate']
+            ):
+                saturation = step['rate']
+
+        if saturation is None:
+            self.stdout.write(self.style.SUCCESS(
+                "No saturation within the tested rates"
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Saturation point: {saturation:g} events/s"
+            ))
+
+    def _cleanup(self):
+        users = User.objects.filter(
+            username__startswith=f"loadgen-{self.run_id}-"
+            )
+        Artifact.objects.filter(
+            Q(order__user__in=users) |
+            Q(path__contains=f"/loadgen-{self.run_id}-")
+        ).delete()
+        PendingWelcomeEmail.objects.filter(
+            email__startswith=f"loadgen-{self.run_id}-"
+            ).delete()
+        # Orders, items and profiles cascade with their users
+        users.delete()
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice.tasks import send_statements
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends each user a single statement PDF covering all of their "
+        "orders in a period."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True,
+                            help="First day of the period, YYYY-MM-DD.")
+        parser.add_argument('--end', required=True,
+                            help="Last day of the period, YYYY-MM-DD.")
+        parser.add_argument('--user', action='append', default=[],
+                            help="Only send to this username.")
+
+    def handle(self, *args, **options):
+        for value in (options['start'], options['end']):
+            try:
+                date.fromisoformat(value)
+            except ValueError:
+                raise CommandError(
+                    f"Invalid date {value!r}, expected YYYY-MM-DD"
+                    )
+
+        result = send_statements(
+            options['start'], options['end'], options['user'] or None
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Sent {result['sent']} statements")
+            )
+        if result['failed']:
+            self.stderr.write(
+                f"Failed for {len(result['failed'])} users, retry with: "
+                + " ".join(f"--user {name}" for name in result['failed'])
+            )
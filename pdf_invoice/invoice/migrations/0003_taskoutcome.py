@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoice", "0002_remove_order_amount_items"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskOutcome",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("task_name", models.CharField(max_length=255)),
+                ("status", models.CharField(max_length=50)),
+                ("day", models.DateField()),
+                ("count", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("task_name", "status", "day"),
+                        name="unique_task_outcome_per_day",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoice", "0005_artifact"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="artifact",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("invoice", "Invoice"),
+                    ("statement", "Statement"),
+                    ("profile_image", "Profile image"),
+                ],
+                max_length=50,
+            ),
+        ),
+    ]
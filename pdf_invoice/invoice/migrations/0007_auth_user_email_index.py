@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db import migrations
+
+INDEX_NAME = "invoice_auth_user_email_idx"
+
+
+def user_table(apps, schema_editor):
+    """
+    Returns the quoted table of the configured user model.
+    """
+    user_model = apps.get_model(settings.AUTH_USER_MODEL)
+    return schema_editor.quote_name(user_model._meta.db_table)
+
+
+def create_email_index(apps, schema_editor):
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+        f"ON {user_table(apps, schema_editor)} (email)"
+    )
+
+
+def drop_email_index(apps, schema_editor):
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+    """
+    Indexes the user model's email for the exact email search in the admin.
+    """
+
+    dependencies = [
+        ("invoice", "0006_artifact_statement_kind"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_email_index, drop_email_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("invoice", "0008_pendingwelcomeemail"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskLock",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("locked_until", models.DateTimeField()),
+            ],
+        ),
+    ]
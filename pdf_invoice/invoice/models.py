@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class Order(models.Model):
@@ -7,7 +8,15 @@ class Order(models.Model):
     Order model with user and date of creation fields.
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'created_at'],
+                name='order_user_created_idx'
+                )
+        ]
 
     def total_amount(self):
         """
@@ -57,3 +66,100 @@ class UserProfile(models.Model):
 
     def __str__(self):
         return f"Profile of {self.user.username}"
+
+
+class TaskOutcome(models.Model):
+    """
+    TaskOutcome model with task_name, status, day and count fields.
+
+    Keeps one counter row per task, status and day instead of one
+    result row per task execution.
+    """
+    task_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=50)
+    day = models.DateField()
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['task_name', 'status', 'day'],
+                name='unique_task_outcome_per_day'
+                )
+        ]
+
+    def __str__(self):
+        return f"{self.task_name} {self.status} {self.day}: {self.count}"
+
+
+class Artifact(models.Model):
+    """
+    Artifact model indexing every generated file kept in artifact storage.
+
+    Files live at a sharded path until they are packed into a monthly
+    archive, after which archive names the zip holding the file.
+    """
+    INVOICE = 'invoice'
+    STATEMENT = 'statement'
+    PROFILE_IMAGE = 'profile_image'
+    KIND_CHOICES = [
+        (INVOICE, 'Invoice'),
+        (STATEMENT, 'Statement'),
+        (PROFILE_IMAGE, 'Profile image'),
+    ]
+
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES)
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='artifacts'
+        )
+    path = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    checksum = models.CharField(max_length=64)
+    archive = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['kind', 'created_at'],
+                name='artifact_kind_created_idx'
+                )
+        ]
+
+    def __str__(self):
+        return self.path
+
+
+class PendingWelcomeEmail(models.Model):
+    """
+    PendingWelcomeEmail model buffering welcome emails for new users.
+
+    Rows are sent in batches by the flush_welcome_emails task and
+    deleted once delivered.
+    """
+    email = models.EmailField()
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Welcome email to {self.email}"
+
+
+class TaskLock(models.Model):
+    """
+    TaskLock model with name and locked_until fields.
+
+    Keeps periodic tasks single-flight across workers. A lock whose
+    locked_until has passed is free, so a crashed holder can't keep
+    it forever.
+    """
+    name = models.CharField(max_length=255, primary_key=True)
+    locked_until = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} locked until {self.locked_until}"
@@ -0,0 +1,22 @@
+import time
+
+
+class RateLimiter:
+    """
+    Paces calls to at most `rate` per second by sleeping between them.
+
+    A rate of 0 disables the limit.
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_at = 0.0
+
+    def wait(self):
+        """
+        Blocks until the next call is allowed.
+        """
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
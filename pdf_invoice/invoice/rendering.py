@@ -0,0 +1,304 @@
+import io
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.platypus import (
+    SimpleDocTemplate,
+    Paragraph,
+    Spacer,
+    Table,
+    TableStyle
+)
+
+# Rendering works on plain data so it can run in worker processes
+# without database access.
+
+
+def invoice_data(order):
+    """
+    Collects the data shown on an order's invoice.
+
+    Args:
+    order: The Order to invoice, ideally with user and items preloaded.
+
+    Returns:
+    dict: The order id, customer name, item rows and total amount.
+    """
+    items = [
+        (item.item_name, item.quantity, item.price, item.total_price())
+        for item in order.items.all()
+    ]
+    return {
+        'order_id': order.id,
+        'customer': order.user.username,
+        'items': items,
+        'total': sum(total for *_, total in items),
+    }
+
+
+def invoice_table(data):
+    """
+    Builds the item table of an invoice.
+
+    Args:
+    data: Invoice data as returned by invoice_data.
+
+    Returns:
+    Table: Item rows followed by the total amount row.
+    """
+    rows = [["Item", "Quantity", "Price", "Total"]]
+    for name, quantity, price, total in data['items']:
+        rows.append([name, str(quantity), f"${price}", f"${total}"])
+
+    # Add total row
+    rows.append(["", "", "Total Amount", f"${data['total']}"])
+
+    table = Table(rows, colWidths=[200, 100, 100, 100])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ]))
+    return table
+
+
+def render_invoice(data):
+    """
+    Renders an invoice PDF.
+
+    Args:
+    data: Invoice data as returned by invoice_data.
+
+    Returns:
+    bytes: The PDF document.
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+
+    styles = getSampleStyleSheet()
+    elements = []
+
+    # Title
+    elements.append(Paragraph("INVOICE", styles['Title']))
+    elements.append(Spacer(1, 12))
+
+    # User info
+    elements.append(
+        Paragraph(f"Customer: {data['customer']}", styles['Normal'])
+        )
+    elements.append(
+        Paragraph(f"Order ID: {data['order_id']}", styles['Normal'])
+        )
+    elements.append(Spacer(1, 12))
+
+    elements.append(invoice_table(data))
+    elements.append(Spacer(1, 20))
+
+    # Thank you message
+    elements.append(
+        Paragraph("Thank you for your purchase!", styles['Normal'])
+        )
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+# Fixed layout of the canvas renderer, matching what SimpleDocTemplate and
+# the invoice table produce on A4: 72pt margins plus the 6pt frame padding,
+# 18pt rows and the 500pt table centred on the page.
+PAGE_WIDTH, PAGE_HEIGHT = A4
+CONTENT_LEFT = 72 + 6
+CONTENT_TOP = PAGE_HEIGHT - 72 - 6
+CONTENT_BOTTOM = 72 + 6
+COLUMN_WIDTHS = [200, 100, 100, 100]
+TABLE_LEFT = (PAGE_WIDTH - sum(COLUMN_WIDTHS)) / 2
+COLUMN_EDGES = [
+    TABLE_LEFT + sum(COLUMN_WIDTHS[:i]) for i in range(len(COLUMN_WIDTHS) + 1)
+]
+COLUMN_CENTRES = [
+    (left + right) / 2 for left, right in zip(COLUMN_EDGES, COLUMN_EDGES[1:])
+]
+ROW_HEIGHT = 18
+# Baseline of 10pt text above the bottom of its row (3pt bottom padding
+# plus the font descent)
+ROW_BASELINE = 5
+
+
+def render_invoice_canvas(data):
+    """
+    Renders the same invoice as render_invoice by drawing directly on a
+    canvas, skipping platypus layout and wrapping.
+
+    Args:
+    data: Invoice data as returned by invoice_data.
+
+    Returns:
+    bytes: The PDF document.
+    """
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+
+    # Title
+    y = CONTENT_TOP
+    pdf.setFont('Helvetica-Bold', 18)
+    pdf.drawCentredString(PAGE_WIDTH / 2, y - 18, "INVOICE")
+    y -= 22 + 6 + 12
+
+    # User info
+    pdf.setFont('Helvetica', 10)
+    pdf.drawString(CONTENT_LEFT, y - 10, f"Customer: {data['customer']}")
+    pdf.drawString(CONTENT_LEFT, y - 22, f"Order ID: {data['order_id']}")
+    y -= 24 + 12
+
+    rows = [["Item", "Quantity", "Price", "Total"]]
+    for name, quantity, price, total in data['items']:
+        rows.append([name, str(quantity), f"${price}", f"${total}"])
+    rows.append(["", "", "Total Amount", f"${data['total']}"])
+
+    # Table, split into page sized chunks
+    start = 0
+    while start < len(rows):
+        fits = max(1, int((y - CONTENT_BOTTOM) // ROW_HEIGHT))
+        chunk = rows[start:start + fits]
+        top = y
+        bottom = top - len(chunk) * ROW_HEIGHT
+
+        if start == 0:
+            pdf.setFillColor(colors.lightblue)
+            pdf.rect(
+                TABLE_LEFT, top - ROW_HEIGHT, sum(COLUMN_WIDTHS), ROW_HEIGHT,
+                stroke=0, fill=1
+                )
+
+        # One text object per page instead of one per cell
+        text = pdf.beginText()
+        for index, row in enumerate(chunk, start):
+            if index == 0:
+                font = 'Helvetica-Bold'
+                text.setFillColor(colors.white)
+                text.setFont(font, 10)
+            elif index in (1, start):
+                font = 'Helvetica'
+                text.setFillColor(colors.black)
+                text.setFont(font, 10)
+            baseline = y - ROW_HEIGHT + ROW_BASELINE
+            for centre, value in zip(COLUMN_CENTRES, row):
+                if value:
+                    text.setTextOrigin(
+                        centre - stringWidth(value, font, 10) / 2, baseline
+                        )
+                    text.textOut(value)
+            y -= ROW_HEIGHT
+        pdf.drawText(text)
+
+        # Grid
+        pdf.setStrokeColor(colors.black)
+        pdf.setLineWidth(1)
+        lines = [
+            (COLUMN_EDGES[0], top - i * ROW_HEIGHT,
+             COLUMN_EDGES[-1], top - i * ROW_HEIGHT)
+            for i in range(len(chunk) + 1)
+        ]
+        lines += [(x, top, x, bottom) for x in COLUMN_EDGES]
+        pdf.lines(lines)
+
+        start += len(chunk)
+        if start < len(rows):
+            pdf.showPage()
+            y = CONTENT_TOP
+
+    # Thank you message
+    y -= 20
+    if y - 12 < CONTENT_BOTTOM:
+        pdf.showPage()
+        y = CONTENT_TOP
+    pdf.setFillColor(colors.black)
+    pdf.setFont('Helvetica', 10)
+    pdf.drawString(CONTENT_LEFT, y - 10, "Thank you for your purchase!")
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+RENDERERS = {
+    'platypus': render_invoice,
+    'canvas': render_invoice_canvas,
+}
+
+
+def get_renderer(template=None):
+    """
+    Returns the invoice renderer for a template.
+
+    Args:
+    template: 'platypus' or 'canvas', defaults to INVOICE_TEMPLATE.
+
+    Returns:
+    callable: Function rendering invoice data into PDF bytes.
+    """
+    from django.conf import settings
+
+    template = template or settings.INVOICE_TEMPLATE
+    try:
+        return RENDERERS[template]
+    except KeyError:
+        raise ValueError(f"Unknown invoice template {template!r}")
+
+
+def render_statement(data):
+    """
+    Renders a statement PDF with one section per order and a grand total.
+
+    Args:
+    data: Statement data as yielded by statements.iter_statements.
+
+    Returns:
+    bytes: The PDF document.
+    """
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+
+    styles = getSampleStyleSheet()
+    elements = []
+
+    # Title
+    elements.append(Paragraph("STATEMENT", styles['Title']))
+    elements.append(Spacer(1, 12))
+
+    # User info
+    elements.append(
+        Paragraph(f"Customer: {data['customer']}", styles['Normal'])
+        )
+    elements.append(Paragraph(
+        f"Period: {data['start']:%Y-%m-%d} to {data['end']:%Y-%m-%d}",
+        styles['Normal']
+        ))
+    elements.append(Spacer(1, 12))
+
+    # One section per order
+    for order in data['orders']:
+        elements.append(Paragraph(
+            f"Order ID: {order['order_id']} ({order['created_at']:%Y-%m-%d})",
+            styles['Heading3']
+            ))
+        elements.append(invoice_table(order))
+        elements.append(Spacer(1, 12))
+
+    elements.append(Paragraph(
+        f"Grand Total: ${data['total']}", styles['Heading2']
+        ))
+    elements.append(Spacer(1, 20))
+
+    # Thank you message
+    elements.append(
+        Paragraph("Thank you for your purchase!", styles['Normal'])
+        )
+
+    doc.build(elements)
+    return buffer.getvalue()
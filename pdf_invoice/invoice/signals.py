@@ -1,30 +1,60 @@
+from importlib import import_module
+from celery import current_app
+from celery.signals import task_failure, task_retry, task_success
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import F
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from .tasks import (
-    send_welcome_email,
-    generate_and_send_invoices,
-    resize_user_image
-)
-from .models import Items, UserProfile
+from django.utils import timezone
+from .models import Items, UserProfile, TaskOutcome, PendingWelcomeEmail
+
+
+def enqueue(task_name, *args):
+    """
+    Sends a task by name, so the web process never imports invoice.tasks
+    and its rendering and imaging dependencies.
+
+    Args:
+    task_name: The registered name of the task.
+    args: Positional arguments for the task.
+    """
+    # send_task bypasses task_always_eager, so honour it here. Running
+    # inline needs the task module, which only workers autodiscover.
+    if current_app.conf.task_always_eager:
+        import_module(task_name.rpartition('.')[0])
+        return current_app.tasks[task_name].apply(args)
+    # The worker honours the message's ignore_result over the task's own
+    # setting, and send_task defaults it to False.
+    return current_app.send_task(
+        task_name,
+        args=args,
+        ignore_result=current_app.conf.task_ignore_result
+        )
 
 
 @receiver(post_save, sender=User)
 def send_email_on_user_creation(sender, instance, created, **kwargs):
     """
-    Sends a welcome email when a new user is created.
+    Buffers a welcome email when a new user is created.
+
+    The buffer is sent in rate-limited batches by flush_welcome_emails.
     """
-    if created:
-        send_welcome_email.delay(instance.email)
+    if created and instance.email:
+        PendingWelcomeEmail.objects.create(email=instance.email)
 
 
 @receiver(post_save, sender=Items)
 def invoice_signal(sender, instance, created, **kwargs):
     """
     Generates and sends an invoice when a new item is created.
+
+    In statement delivery, orders are only sent as part of the periodic
+    statements.
     """
-    if created:
-        generate_and_send_invoices.delay(
+    if created and settings.INVOICE_DELIVERY != 'statement':
+        enqueue(
+            'invoice.tasks.generate_and_send_invoices',
             instance.order.id,
             instance.order.user.email
             )
@@ -36,4 +66,46 @@ def image_resize_signal(sender, instance, **kwargs):
     Resizes the user's profile image after saving.
     """
     if instance.image:
-        resize_user_image.delay(instance.image.path)
+        enqueue('invoice.tasks.resize_user_image', instance.image.path)
+
+
+def record_task_outcome(task_name, status):
+    """
+    Increments the daily outcome counter for a task.
+
+    Args:
+    task_name: The registered name of the task.
+    status: The outcome of the task, e.g. SUCCESS, FAILURE or RETRY.
+    """
+    outcome, created = TaskOutcome.objects.get_or_create(
+        task_name=task_name,
+        status=status,
+        day=timezone.now().date(),
+        defaults={'count': 1}
+    )
+    if not created:
+        TaskOutcome.objects.filter(pk=outcome.pk).update(count=F('count') + 1)
+
+
+@task_success.connect
+def task_success_signal(sender=None, **kwargs):
+    """
+    Counts a successful task execution.
+    """
+    record_task_outcome(sender.name, 'SUCCESS')
+
+
+@task_failure.connect
+def task_failure_signal(sender=None, **kwargs):
+    """
+    Counts a failed task execution.
+    """
+    record_task_outcome(sender.name, 'FAILURE')
+
+
+@task_retry.connect
+def task_retry_signal(sender=None, **kwargs):
+    """
+    Counts a task retry.
+    """
+    record_task_outcome(sender.name, 'RETRY')
@@ -0,0 +1,76 @@
+from itertools import groupby
+
+from django.contrib.auth.models import User
+
+from .models import Items
+
+
+def iter_statements(start, end, usernames=None, batch_size=100):
+    """
+    Yields the statement data of every user with orders in a period.
+
+    Users are processed in batches and all items of a batch are fetched
+    with a single query, grouped by user and then by order.
+
+    Args:
+    start: Aware datetime of the start of the period.
+    end: Aware datetime of the end of the period.
+    usernames: Only build statements for these usernames, if given.
+    batch_size: Number of users per items query.
+
+    Yields:
+    dict: The user id, customer, email, period, per-order invoice data
+    and the grand total.
+    """
+    users = User.objects.filter(
+        order__created_at__range=(start, end)
+        ).distinct().order_by('id')
+    if usernames:
+        users = users.filter(username__in=usernames)
+
+    last_id = 0
+    while True:
+        user_ids = list(
+            users.filter(id__gt=last_id).values_list('id', flat=True)[
+                :batch_size
+                ]
+            )
+        if not user_ids:
+            return
+        last_id = user_ids[-1]
+
+        items = Items.objects.filter(
+            order__user_id__in=user_ids,
+            order__created_at__range=(start, end)
+        ).select_related('order__user').order_by(
+            'order__user_id', 'order_id', 'id'
+            )
+
+        for _, user_items in groupby(items, key=lambda i: i.order.user_id):
+            orders = []
+            for order, order_items in groupby(
+                user_items, key=lambda i: i.order
+            ):
+                rows = [
+                    (i.item_name, i.quantity, i.price, i.total_price())
+                    for i in order_items
+                ]
+                orders.append({
+                    'order_id': order.id,
+                    'created_at': order.created_at,
+                    'items': rows,
+                    'total': sum(total for *_, total in rows),
+                })
+            user = order.user
+            yield {
+                'user_id': user.id,
+                'customer': user.username,
+                'email': user.email,
+                'start': start,
+                'end': end,
+                'orders': orders,
+                'total': sum(o['total'] for o in orders),
+            }
+
+        if len(user_ids) < batch_size:
+            return
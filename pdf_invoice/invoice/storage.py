@@ -0,0 +1,142 @@
+import hashlib
+import os
+import zipfile
+from itertools import groupby
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+from .models import Artifact
+
+
+class ArtifactStorage(FileSystemStorage):
+    """
+    File storage for generated artifacts such as invoices and thumbnails.
+
+    Files are spread over two levels of directories named after the
+    hash of their file name, so no single directory grows to millions
+    of entries. Saving a name that already exists replaces the file.
+    """
+    def shard(self, kind, filename):
+        """
+        Builds the sharded storage name for a file.
+
+        Args:
+        kind: The artifact kind, used as the top level directory.
+        filename: The file name of the artifact.
+
+        Returns:
+        str: A name like "invoice/3f/a2/invoice_12.pdf".
+        """
+        digest = hashlib.md5(filename.encode()).hexdigest()
+        return '/'.join([kind, digest[:2], digest[2:4], filename])
+
+    def get_available_name(self, name, max_length=None):
+        if self.exists(name):
+            self.delete(name)
+        return name
+
+
+artifact_storage = ArtifactStorage()
+
+
+def store_artifact(kind, filename, content, order=None):
+    """
+    Saves a generated file and records it in the artifact index.
+
+    Args:
+    kind: The artifact kind, one of Artifact.KIND_CHOICES.
+    filename: The file name of the artifact.
+    content: The file contents as bytes.
+    order: The order the artifact belongs to, if any.
+
+    Returns:
+    Artifact: The index entry of the stored file.
+    """
+    name = artifact_storage.save(
+        artifact_storage.shard(kind, filename),
+        ContentFile(content)
+        )
+    artifact, _ = Artifact.objects.update_or_create(
+        path=name,
+        defaults={
+            'kind': kind,
+            'order': order,
+            'size': len(content),
+            'checksum': hashlib.sha256(content).hexdigest(),
+            'archive': '',
+        }
+    )
+    return artifact
+
+
+def read_artifact(artifact):
+    """
+    Reads the contents of an artifact, whether loose or archived.
+
+    Args:
+    artifact: The Artifact to read.
+
+    Returns:
+    bytes: The file contents.
+    """
+    if artifact.archive:
+        with zipfile.ZipFile(artifact_storage.path(artifact.archive)) as zf:
+            return zf.read(artifact.path)
+    with artifact_storage.open(artifact.path) as f:
+        return f.read()
+
+
+def pack_artifacts(kind, older_than):
+    """
+    Moves loose artifacts into compressed monthly zip archives.
+
+    Zip archives keep a central directory, so a single file can still
+    be read without decompressing the rest of the month.
+
+    Args:
+    kind: The artifact kind to pack.
+    older_than: Only artifacts created before this datetime are packed.
+
+    Returns:
+    int: Number of packed artifacts.
+    """
+    artifacts = Artifact.objects.filter(
+        kind=kind,
+        archive='',
+        created_at__lt=older_than
+    ).order_by('created_at')
+
+    def month(artifact):
+        return timezone.localtime(artifact.created_at).strftime('%Y-%m')
+
+    packed = 0
+    for period, group in groupby(artifacts.iterator(), key=month):
+        group = list(group)
+        archive = f"archives/{kind}/{period}.zip"
+        archive_path = artifact_storage.path(archive)
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+
+        checksums = {}
+        with zipfile.ZipFile(
+            archive_path, 'a', compression=zipfile.ZIP_DEFLATED
+        ) as zf:
+            for artifact in group:
+                with artifact_storage.open(artifact.path) as f:
+                    content = f.read()
+                zf.writestr(artifact.path, content)
+                checksums[artifact] = hashlib.sha256(content).hexdigest()
+
+        for artifact, checksum in checksums.items():
+            # Skip artifacts regenerated since they were read, their
+            # loose file is newer than the archived copy.
+            updated = Artifact.objects.filter(
+                id=artifact.id,
+                archive='',
+                checksum=checksum
+            ).update(archive=archive)
+            if updated:
+                artifact_storage.delete(artifact.path)
+                packed += 1
+    return packed
@@ -1,22 +1,28 @@
 from celery import shared_task
-from django.core.mail import send_mail, EmailMessage
-from reportlab.platypus import (
-    SimpleDocTemplate,
-    Paragraph,
-    Spacer,
-    Table,
-    TableStyle
-)
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-from PIL import Image
+from django.core.mail import send_mail, EmailMessage, get_connection
 from django.conf import settings
-import requests
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+import io
 import os
 import random
+from smtplib import SMTPServerDisconnected
+from datetime import date, datetime, time as dt_time, timedelta
 from django.contrib.auth.models import User
-from .models import Order
+from django.db import transaction
+from .models import Order, Artifact, PendingWelcomeEmail
+from .locks import single_flight
+from .ratelimit import RateLimiter
+from .storage import store_artifact, pack_artifacts
+
+# ReportLab, PIL and requests are imported inside the tasks that use
+# them, so processes that only send tasks don't pay for loading them.
+
+
+WELCOME_SUBJECT = "Welcome Email"
+WELCOME_MESSAGE = "Hi there,\n\nThank you for\
+            registering with us. We're excited to have you on board!"
+WELCOME_FROM = "admin@gmail.com"
 
 
 @shared_task(bind=True, max_retries=3)
@@ -30,14 +36,11 @@ def send_welcome_email(self, user_email):
     Retries up to 3 times in case of failure with a 10-second delay.
     """
     try:
-        subject = "Welcome Email"
-        message = "Hi there,\n\nThank you for\
-            registering with us. We're excited to have you on board!"
-        from_email = "admin@gmail.com"
-
         recipient_list = [user_email]
 
-        send_mail(subject, message, from_email, recipient_list)
+        send_mail(
+            WELCOME_SUBJECT, WELCOME_MESSAGE, WELCOME_FROM, recipient_list
+            )
         print(f"Sending email to : {user_email}")
         return f"Email sent to {user_email}"
 
@@ -46,73 +49,243 @@ def send_welcome_email(self, user_email):
 
 
 @shared_task
-def generate_and_send_invoices(order_id, user_email):
+def flush_welcome_emails():
+    """
+    Sends a batch of buffered welcome emails over one mail connection.
+
+    At most WELCOME_EMAIL_BATCH_SIZE emails are sent per run, paced to
+    WELCOME_EMAIL_RATE_PER_SECOND. Runs are single-flight: a run that
+    starts while another is still sending does nothing, so overlapping
+    runs never add up to more than the rate. Only the recipients that
+    failed are retried, with exponential backoff, until
+    WELCOME_EMAIL_MAX_ATTEMPTS.
+
+    Returns:
+    dict: Number of sent, retried and dropped emails.
+    """
+    rate = settings.WELCOME_EMAIL_RATE_PER_SECOND
+    batch_size = settings.WELCOME_EMAIL_BATCH_SIZE
+    # Long enough to send a full batch, after which a crashed run's
+    # lock expires on its own.
+    ttl = timedelta(seconds=batch_size / rate + 60 if rate else 60)
+
+    with single_flight(flush_welcome_emails.name, ttl) as acquired:
+        if not acquired:
+            return {'sent': 0, 'retried': 0, 'dropped': 0}
+        return _send_welcome_batch(rate, batch_size, ttl)
+
+
+def _send_welcome_batch(rate, batch_size, lease):
+    """
+    Claims and sends one batch of due welcome emails.
+    """
+    now = timezone.now()
+    # Claim the batch by pushing it out of reach of later flushes for
+    # as long as sending it can take.
+    with transaction.atomic():
+        batch = list(
+            PendingWelcomeEmail.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+        PendingWelcomeEmail.objects.filter(
+            id__in=[pending.id for pending in batch]
+            ).update(next_attempt_at=now + lease)
+    if not batch:
+        return {'sent': 0, 'retried': 0, 'dropped': 0}
+
+    sent, failed = [], []
+    limiter = RateLimiter(rate)
+    try:
+        with get_connection() as connection:
+            for index, pending in enumerate(batch):
+                limiter.wait()
+                try:
+                    EmailMessage(
+                        WELCOME_SUBJECT,
+                        WELCOME_MESSAGE,
+                        WELCOME_FROM,
+                        [pending.email],
+                        connection=connection
+                    ).send()
+                except SMTPServerDisconnected:
+                    failed.append(pending)
+                    # Start a new session for the rest of the batch,
+                    # instead of letting each message open its own.
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception:
+                        failed.extend(batch[index + 1:])
+                        break
+                except Exception:
+                    # A refused recipient leaves the session usable
+                    failed.append(pending)
+                else:
+                    sent.append(pending.id)
+    finally:
+        # Record what was delivered even if sending is cut short, so it
+        # isn't sent again when the lease expires.
+        dropped = _record_welcome_results(sent, failed)
+
+    return {
+        'sent': len(sent),
+        'retried': len(failed) - dropped,
+        'dropped': dropped,
+    }
+
+
+def _record_welcome_results(sent, failed):
+    """
+    Deletes delivered welcome emails and schedules retries of the failed
+    ones, dropping those out of attempts.
+
+    Returns:
+    int: Number of dropped emails.
+    """
+    PendingWelcomeEmail.objects.filter(id__in=sent).delete()
+
+    dropped = []
+    for pending in failed:
+        pending.attempts += 1
+        if pending.attempts >= settings.WELCOME_EMAIL_MAX_ATTEMPTS:
+            dropped.append(pending.id)
+            continue
+        pending.next_attempt_at = timezone.now() + timedelta(
+            seconds=settings.WELCOME_EMAIL_RETRY_DELAY * 2 ** (
+                pending.attempts - 1
+                )
+        )
+        pending.save(update_fields=['attempts', 'next_attempt_at'])
+    PendingWelcomeEmail.objects.filter(id__in=dropped).delete()
+    return len(dropped)
+
+
+@shared_task
+def generate_and_send_invoices(order_id, user_email, template=None):
     """
     Generates a PDF invoice for the given order and sends it via email.
 
     Args:
     order_id: The ID of the order.
     user_email: The recipient's email address.
+    template: The invoice renderer, defaults to INVOICE_TEMPLATE.
     """
-    order = Order.objects.get(id=order_id)
+    from .rendering import invoice_data, get_renderer
 
-    pdf_path = os.path.join(settings.MEDIA_ROOT, f'invoice_{order_id}.pdf')
-    doc = SimpleDocTemplate(pdf_path, pagesize=A4)
+    order = Order.objects.prefetch_related('items').select_related(
+        'user'
+        ).get(id=order_id)
 
-    styles = getSampleStyleSheet()
-    elements = []
+    filename = f'invoice_{order_id}.pdf'
+    pdf = get_renderer(template)(invoice_data(order))
+    store_artifact(Artifact.INVOICE, filename, pdf, order=order)
+    send_invoice_email(user_email, filename, pdf)
 
-    # Title
-    elements.append(Paragraph("INVOICE", styles['Title']))
-    elements.append(Spacer(1, 12))
 
-    # User info
-    elements.append(
-        Paragraph(f"Customer: {order.user.username}", styles['Normal'])
-        )
-    elements.append(Paragraph(f"Order ID: {order.id}", styles['Normal']))
-    elements.append(Spacer(1, 12))
-
-    # Table data
-    data = [["Item", "Quantity", "Price", "Total"]]
-    for item in order.items.all():
-        data.append([
-            item.item_name,
-            str(item.quantity),
-            f"${item.price}",
-            f"${item.total_price()}"
-        ])
-
-    # Add total row
-    data.append(["", "", "Total Amount", f"${order.total_amount()}"])
-
-    table = Table(data, colWidths=[200, 100, 100, 100])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-    ]))
-
-    elements.append(table)
-    elements.append(Spacer(1, 20))
-
-    # Thank you message
-    elements.append(
-        Paragraph("Thank you for your purchase!", styles['Normal'])
-        )
-
-    doc.build(elements)
+def send_invoice_email(user_email, filename, pdf):
+    """
+    Emails a rendered invoice to the customer.
 
-    # Send email
+    Args:
+    user_email: The recipient's email address.
+    filename: The attachment file name.
+    pdf: The invoice PDF as bytes.
+    """
     email = EmailMessage(
         'Order Invoice',
         'Please find your invoice attached.',
         'admin@gmail.com',
         [user_email]
     )
-    email.attach_file(pdf_path)
+    email.attach(filename, pdf, 'application/pdf')
+    email.send()
+
+
+@shared_task
+def send_statements(start=None, end=None, usernames=None):
+    """
+    Sends every user one statement PDF covering all their orders in a
+    period, instead of one invoice per order.
+
+    A statement that fails to render or send is skipped, and the rest are
+    still sent. Passing the failed usernames back as usernames retries
+    only those.
+
+    Args:
+    start: First day of the period, YYYY-MM-DD. Defaults, like end, to
+    the previous calendar month.
+    end: Last day of the period, YYYY-MM-DD.
+    usernames: Only send statements to these usernames, if given.
+
+    Returns:
+    dict: Number of sent statements and the usernames that failed.
+    """
+    from .statements import iter_statements
+
+    if start is None and end is None:
+        last_day = timezone.localdate().replace(day=1) - timedelta(days=1)
+        start = last_day.replace(day=1).isoformat()
+        end = last_day.isoformat()
+
+    period = (
+        timezone.make_aware(
+            datetime.combine(date.fromisoformat(start), dt_time.min)
+            ),
+        timezone.make_aware(
+            datetime.combine(date.fromisoformat(end), dt_time.max)
+            ),
+    )
+
+    sent, failed = 0, []
+    connected = True
+    # All statements go out over one SMTP connection
+    with get_connection() as connection:
+        for statement in iter_statements(*period, usernames=usernames):
+            if not connected:
+                failed.append(statement['customer'])
+                continue
+            try:
+                send_statement(statement, start, end, connection)
+            except SMTPServerDisconnected:
+                failed.append(statement['customer'])
+                # Start a new session for the remaining statements
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    connected = False
+            except Exception:
+                failed.append(statement['customer'])
+            else:
+                sent += 1
+    return {'sent': sent, 'failed': failed}
+
+
+def send_statement(statement, start, end, connection):
+    """
+    Renders, stores and emails one user's statement.
+
+    Args:
+    statement: Statement data as yielded by statements.iter_statements.
+    start: First day of the period, YYYY-MM-DD.
+    end: Last day of the period, YYYY-MM-DD.
+    connection: The mail connection to send over.
+    """
+    from .rendering import render_statement
+
+    filename = f"statement_{statement['user_id']}_{start}_{end}.pdf"
+    pdf = render_statement(statement)
+    store_artifact(Artifact.STATEMENT, filename, pdf)
+
+    email = EmailMessage(
+        'Order Statement',
+        f'Please find your statement for {start} to {end} attached.',
+        'admin@gmail.com',
+        [statement['email']],
+        connection=connection
+    )
+    email.attach(filename, pdf, 'application/pdf')
     email.send()
 
 
@@ -135,7 +308,8 @@ def send_daily_summary():
         bind=True,
         autoretry_for=(Exception,),
         retry_backoff=True,
-        max_retries=5
+        max_retries=5,
+        ignore_result=False
         )
 def send_data_to_api(self, data):
     """
@@ -146,6 +320,8 @@ def send_data_to_api(self, data):
 
     Automatically retries on failure up to 5 times with exponential backoff.
     """
+    import requests
+
     if random.choice([True, False]):
         raise Exception("Simulated API Failure")
 
@@ -162,10 +338,58 @@ def resize_user_image(image_path):
     Args:
     image_path: The path to the original image file.
     """
+    from PIL import Image
+
     sizes = [(100, 100), (300, 300)]
+    base, ext = os.path.splitext(os.path.basename(image_path))
     for size in sizes:
         img = Image.open(image_path)
         img.thumbnail(size)
-        base, ext = os.path.splitext(image_path)
-        new_path = f"{base}_{size[0]}x{size[1]}{ext}"
-        img.save(new_path)
+        buffer = io.BytesIO()
+        img.save(buffer, format=img.format)
+        store_artifact(
+            Artifact.PROFILE_IMAGE,
+            f"{base}_{size[0]}x{size[1]}{ext}",
+            buffer.getvalue()
+            )
+
+
+@shared_task
+def prune_task_results():
+    """
+    Deletes stored task results older than the retention period.
+
+    Rows are deleted in batches of CELERY_RESULT_PRUNE_BATCH_SIZE so a
+    large backlog never holds a long write lock on the results table.
+
+    Returns:
+    int: Number of deleted task results.
+    """
+    cutoff = timezone.now() - timedelta(
+        days=settings.CELERY_RESULT_RETENTION_DAYS
+        )
+    batch_size = settings.CELERY_RESULT_PRUNE_BATCH_SIZE
+    expired = TaskResult.objects.filter(date_done__lt=cutoff)
+
+    deleted = 0
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        deleted += TaskResult.objects.filter(id__in=ids).delete()[0]
+    return deleted
+
+
+@shared_task
+def pack_invoice_archives():
+    """
+    Packs invoices older than INVOICE_ARCHIVE_AFTER_DAYS into compressed
+    monthly archives.
+
+    Returns:
+    int: Number of packed invoices.
+    """
+    cutoff = timezone.now() - timedelta(
+        days=settings.INVOICE_ARCHIVE_AFTER_DAYS
+        )
+    return pack_artifacts(Artifact.INVOICE, cutoff)
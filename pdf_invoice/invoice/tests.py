@@ -1,12 +1,36 @@
+import base64
+import io
+import json
 import os
+import re
 import tempfile
 import shutil
+import smtplib
+import subprocess
+import sys
+import zipfile
+import zlib
 from unittest import mock
 from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
-from .models import Order, Items, UserProfile
+from .models import (
+    Order, Items, UserProfile, TaskOutcome, Artifact, PendingWelcomeEmail,
+    TaskLock
+)
+from .locks import acquire_lock, single_flight
+from .management.commands.invoice_run import Command as InvoiceRunCommand
+from .ratelimit import RateLimiter
+from .storage import artifact_storage, store_artifact, read_artifact
+from .statements import iter_statements
+from .rendering import get_renderer, render_invoice, render_invoice_canvas
 from decimal import Decimal
+from datetime import timedelta
+from django.utils import timezone
+from django_celery_results.models import TaskResult
 from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.conf import settings
 from PIL import Image
 
@@ -21,6 +45,10 @@ from .tasks import (
     send_daily_summary,
     send_data_to_api,
     resize_user_image,
+    prune_task_results,
+    pack_invoice_archives,
+    send_statements,
+    flush_welcome_emails,
 )
 
 # Temporary media root for tests
@@ -109,18 +137,22 @@ class SignalTests(TestCase):
         )
         mail.outbox = []
 
-    @mock.patch("invoice.signals.send_welcome_email")
-    def test_welcome_email_signal_triggered(self, mock_task):
+    def test_welcome_email_signal_triggered(self):
         """
         Test case for testing the send emai on user creation function.
         """
         User.objects.create_user(
             username="ali", email="ali@example.com", password="ali"
         )
-        mock_task.delay.assert_called_with("ali@example.com")
+        self.assertTrue(
+            PendingWelcomeEmail.objects.filter(
+                email="ali@example.com"
+                ).exists()
+            )
+        self.assertEqual(len(mail.outbox), 0)
 
-    @mock.patch("invoice.signals.generate_and_send_invoices")
-    def test_invoice_signal_triggered(self, mock_task):
+    @mock.patch("invoice.signals.enqueue")
+    def test_invoice_signal_triggered(self, mock_enqueue):
         """
         Test case for testing the invoice signal function.
         """
@@ -131,10 +163,14 @@ class SignalTests(TestCase):
             quantity=1,
             price=Decimal("10.00")
         )
-        mock_task.delay.assert_called_with(order.id, self.user.email)
+        mock_enqueue.assert_called_with(
+            "invoice.tasks.generate_and_send_invoices",
+            order.id,
+            self.user.email
+            )
 
-    @mock.patch("invoice.signals.resize_user_image")
-    def test_image_resize_signal_triggered(self, mock_task):
+    @mock.patch("invoice.signals.enqueue")
+    def test_image_resize_signal_triggered(self, mock_enqueue):
         """Add
         Test case for testing the image_resize function.
         """
@@ -143,7 +179,29 @@ class SignalTests(TestCase):
         img.save(image_path)
 
         UserProfile.objects.create(user=self.user, image="test.jpg")
-        mock_task.delay.assert_called()
+        mock_enqueue.assert_called_with(
+            "invoice.tasks.resize_user_image",
+            os.path.join(settings.MEDIA_ROOT, "test.jpg")
+            )
+
+    @mock.patch.object(celery_app, "send_task")
+    def test_enqueue_sends_tasks_without_results(self, mock_send_task):
+        """
+        Test case for testing that tasks sent by name don't ask the worker
+        to store their result.
+        """
+        celery_app.conf.task_always_eager = False
+        try:
+            invoice.signals.enqueue(
+                "invoice.tasks.resize_user_image", "test.jpg"
+                )
+        finally:
+            celery_app.conf.task_always_eager = True
+        mock_send_task.assert_called_once_with(
+            "invoice.tasks.resize_user_image",
+            args=("test.jpg",),
+            ignore_result=True
+            )
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -173,8 +231,7 @@ class TaskTests(TestCase):
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn("Welcome Email", mail.outbox[0].subject)
 
-    @mock.patch("invoice.signals.send_welcome_email.delay")
-    def test_generate_and_send_invoice(self, mock_welcome):
+    def test_generate_and_send_invoice(self):
         """
         Test case for testing the generate and send invoices function.
         Ensure invoice generation sends exactly one invoice email
@@ -192,8 +249,9 @@ class TaskTests(TestCase):
 
         generate_and_send_invoices(order.id, self.user.email)
 
-        pdf_path = os.path.join(settings.MEDIA_ROOT, f"invoice_{order.id}.pdf")
-        self.assertTrue(os.path.exists(pdf_path))
+        artifact = Artifact.objects.get(order=order, kind=Artifact.INVOICE)
+        self.assertTrue(artifact.path.endswith(f"invoice_{order.id}.pdf"))
+        self.assertTrue(os.path.exists(artifact_storage.path(artifact.path)))
 
         # Only invoice email should exist
         self.assertEqual(len(mail.outbox), 1)
@@ -225,7 +283,747 @@ class TaskTests(TestCase):
         img.save(image_path)
 
         resize_user_image(image_path)
-        resized_100 = os.path.join(settings.MEDIA_ROOT, "test_100x100.jpg")
-        resized_300 = os.path.join(settings.MEDIA_ROOT, "test_300x300.jpg")
-        self.assertTrue(os.path.exists(resized_100))
-        self.assertTrue(os.path.exists(resized_300))
+        for name in ["test_100x100.jpg", "test_300x300.jpg"]:
+            path = artifact_storage.shard(Artifact.PROFILE_IMAGE, name)
+            self.assertTrue(Artifact.objects.filter(path=path).exists())
+            self.assertTrue(os.path.exists(artifact_storage.path(path)))
+
+
+class ResultBackendTests(TestCase):
+    """
+    Class for testing task result pruning and outcome counters.
+    """
+    @override_settings(
+        CELERY_RESULT_RETENTION_DAYS=7,
+        CELERY_RESULT_PRUNE_BATCH_SIZE=2
+        )
+    def test_prune_task_results(self):
+        """
+        Test case for testing that only expired results are pruned.
+        """
+        for i in range(5):
+            TaskResult.objects.create(task_id=f"old-{i}", status="SUCCESS")
+        TaskResult.objects.create(task_id="new", status="SUCCESS")
+        TaskResult.objects.filter(task_id__startswith="old").update(
+            date_done=timezone.now() - timedelta(days=8)
+        )
+
+        self.assertEqual(prune_task_results(), 5)
+        self.assertEqual(
+            list(TaskResult.objects.values_list("task_id", flat=True)),
+            ["new"]
+        )
+
+    def test_task_outcomes_are_aggregated(self):
+        """
+        Test case for testing that executions increment one counter row.
+        """
+        send_welcome_email.apply(args=["imran@example.com"])
+        send_welcome_email.apply(args=["imran@example.com"])
+
+        outcome = TaskOutcome.objects.get(
+            task_name=send_welcome_email.name,
+            status="SUCCESS"
+            )
+        self.assertEqual(outcome.count, 2)
+        self.assertEqual(TaskOutcome.objects.count(), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, INVOICE_ARCHIVE_AFTER_DAYS=30)
+class ArtifactStorageTests(TestCase):
+    """
+    Class for testing the artifact storage.
+    """
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_store_artifact_is_sharded_and_indexed(self):
+        """
+        Test case for testing that artifacts are sharded and indexed.
+        """
+        artifact = store_artifact(Artifact.INVOICE, "invoice_1.pdf", b"pdf")
+
+        kind, first, second, filename = artifact.path.split("/")
+        self.assertEqual(kind, Artifact.INVOICE)
+        self.assertEqual((len(first), len(second)), (2, 2))
+        self.assertEqual(filename, "invoice_1.pdf")
+        self.assertEqual(artifact.size, 3)
+        self.assertEqual(read_artifact(artifact), b"pdf")
+
+        # Storing the same file again replaces it in place
+        store_artifact(Artifact.INVOICE, "invoice_1.pdf", b"new pdf")
+        artifact.refresh_from_db()
+        self.assertEqual(read_artifact(artifact), b"new pdf")
+        self.assertEqual(Artifact.objects.count(), 1)
+
+    def test_pack_invoice_archives(self):
+        """
+        Test case for testing that old invoices are packed per month.
+        """
+        old = store_artifact(Artifact.INVOICE, "invoice_1.pdf", b"old")
+        recent = store_artifact(Artifact.INVOICE, "invoice_2.pdf", b"recent")
+        Artifact.objects.filter(id=old.id).update(
+            created_at=timezone.now() - timedelta(days=60)
+        )
+
+        self.assertEqual(pack_invoice_archives(), 1)
+
+        old.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertTrue(old.archive.endswith(".zip"))
+        self.assertEqual(recent.archive, "")
+        self.assertFalse(artifact_storage.exists(old.path))
+        self.assertEqual(read_artifact(old), b"old")
+
+    def test_pack_skips_artifacts_regenerated_while_packing(self):
+        """
+        Test case for testing that an invoice regenerated while its month
+        is being packed keeps its new loose file.
+        """
+        old = store_artifact(Artifact.INVOICE, "invoice_1.pdf", b"old")
+        Artifact.objects.filter(id=old.id).update(
+            created_at=timezone.now() - timedelta(days=60)
+        )
+        writestr = zipfile.ZipFile.writestr
+
+        def regenerate(zf, *args, **kwargs):
+            writestr(zf, *args, **kwargs)
+            store_artifact(Artifact.INVOICE, "invoice_1.pdf", b"new")
+
+        with mock.patch.object(
+            zipfile.ZipFile, "writestr", autospec=True, side_effect=regenerate
+        ):
+            self.assertEqual(pack_invoice_archives(), 0)
+
+        old.refresh_from_db()
+        self.assertEqual(old.archive, "")
+        self.assertTrue(artifact_storage.exists(old.path))
+        self.assertEqual(read_artifact(old), b"new")
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class InvoiceRunTests(TestCase):
+    """
+    Class for testing the invoice_run management command.
+    """
+    @mock.patch("invoice.signals.enqueue")
+    def setUp(self, mock_enqueue):
+        self.user = User.objects.create_user(
+            username="imran",
+            email="imran@example.com",
+            password="imran",
+        )
+        self.orders = []
+        for i in range(3):
+            order = Order.objects.create(user=self.user)
+            Items.objects.create(
+                order=order,
+                item_name=f"Product {i}",
+                quantity=1,
+                price=Decimal("10.00")
+            )
+            self.orders.append(order)
+        self.checkpoint = os.path.join(TEMP_MEDIA_ROOT, "run.json")
+        os.makedirs(TEMP_MEDIA_ROOT, exist_ok=True)
+        mail.outbox = []
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_invoice_run_renders_and_emails_all_orders(self):
+        """
+        Test case for testing that every selected order is re-invoiced.
+        """
+        call_command(
+            "invoice_run", processes=2, batch_size=2,
+            checkpoint=self.checkpoint, stdout=io.StringIO()
+        )
+        self.assertEqual(
+            Artifact.objects.filter(kind=Artifact.INVOICE).count(), 3
+            )
+        self.assertEqual(len(mail.outbox), 3)
+        with open(self.checkpoint) as f:
+            self.assertEqual(
+                json.load(f)["last_order_id"], self.orders[-1].id
+                )
+
+    def test_invoice_run_resumes_from_checkpoint(self):
+        """
+        Test case for testing that a resumed run skips finished orders.
+        """
+        with open(self.checkpoint, "w") as f:
+            json.dump({"last_order_id": self.orders[1].id}, f)
+
+        call_command(
+            "invoice_run", processes=1, resume=True,
+            checkpoint=self.checkpoint, stdout=io.StringIO()
+        )
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            Artifact.objects.get().order_id, self.orders[-1].id
+            )
+
+    def test_invoice_run_resume_retries_failed_orders(self):
+        """
+        Test case for testing that a resumed run retries the orders the
+        previous run failed, and doesn't move the checkpoint back.
+        """
+        with open(self.checkpoint, "w") as f:
+            json.dump({
+                "last_order_id": self.orders[1].id,
+                "processed": 2,
+                "failed": [self.orders[0].id],
+            }, f)
+
+        call_command(
+            "invoice_run", processes=1, batch_size=1, resume=True,
+            checkpoint=self.checkpoint, stdout=io.StringIO()
+        )
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            set(Artifact.objects.values_list("order_id", flat=True)),
+            {self.orders[0].id, self.orders[-1].id}
+            )
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        self.assertEqual(state["last_order_id"], self.orders[-1].id)
+        self.assertEqual(state["failed"], [])
+
+    def test_interrupted_resume_keeps_failures_not_yet_retried(self):
+        """
+        Test case for testing that an interrupted resumed run keeps the
+        earlier failures it hasn't retried yet in the checkpoint.
+        """
+        with open(self.checkpoint, "w") as f:
+            json.dump({
+                "last_order_id": self.orders[1].id,
+                "processed": 2,
+                "failed": [self.orders[0].id, self.orders[1].id],
+            }, f)
+
+        # Batches are pipelined, the first one is checkpointed while the
+        # third is rendered.
+        render_batch = InvoiceRunCommand._render_batch
+        calls = []
+
+        def interrupt_third_batch(command, *args, **kwargs):
+            calls.append(args)
+            if len(calls) == 3:
+                raise RuntimeError("Interrupted")
+            return render_batch(command, *args, **kwargs)
+
+        with mock.patch.object(
+            InvoiceRunCommand, "_render_batch", interrupt_third_batch
+        ), self.assertRaises(RuntimeError):
+            call_command(
+                "invoice_run", processes=1, batch_size=1, resume=True,
+                checkpoint=self.checkpoint, stdout=io.StringIO()
+            )
+
+        with open(self.checkpoint) as f:
+            state = json.load(f)
+        self.assertEqual(state["last_order_id"], self.orders[1].id)
+        self.assertEqual(state["failed"], [self.orders[1].id])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class StatementTests(TestCase):
+    """
+    Class for testing the consolidated statements.
+    """
+    @mock.patch("invoice.signals.enqueue")
+    def setUp(self, mock_enqueue):
+        self.users = [
+            User.objects.create_user(
+                username=name, email=f"{name}@example.com", password=name
+            )
+            for name in ["imran", "ali"]
+        ]
+        for user in self.users:
+            for i in range(3):
+                order = Order.objects.create(user=user)
+                Items.objects.bulk_create([
+                    Items(
+                        order=order,
+                        item_name="Product A",
+                        quantity=2,
+                        price=Decimal("10.00")
+                    ),
+                    Items(
+                        order=order,
+                        item_name="Product B",
+                        quantity=1,
+                        price=Decimal("5.00")
+                    ),
+                ])
+        self.today = timezone.localdate().isoformat()
+        os.makedirs(TEMP_MEDIA_ROOT, exist_ok=True)
+        mail.outbox = []
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_iter_statements_groups_orders_per_user(self):
+        """
+        Test case for testing that statements hold every order of a user.
+        """
+        start = timezone.now() - timedelta(days=1)
+        end = timezone.now() + timedelta(days=1)
+        with self.assertNumQueries(2):
+            statements = list(iter_statements(start, end, batch_size=10))
+
+        self.assertEqual(
+            [s["customer"] for s in statements], ["imran", "ali"]
+            )
+        self.assertEqual(len(statements[0]["orders"]), 3)
+        self.assertEqual(statements[0]["total"], Decimal("75.00"))
+
+    def test_send_statements_sends_one_email_per_user(self):
+        """
+        Test case for testing that each user gets a single statement.
+        """
+        result = send_statements(self.today, self.today)
+
+        self.assertEqual(result, {"sent": 2, "failed": []})
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            Artifact.objects.filter(kind=Artifact.STATEMENT).count(), 2
+            )
+        self.assertEqual(
+            mail.outbox[0].attachments[0][2], "application/pdf"
+            )
+
+    def test_send_statements_skips_failed_recipients(self):
+        """
+        Test case for testing that one refused recipient doesn't stop the
+        statements of the other users.
+        """
+        send = mail.EmailMessage.send
+
+        def refuse_imran(message, *args, **kwargs):
+            if message.to == ["imran@example.com"]:
+                raise smtplib.SMTPRecipientsRefused({})
+            return send(message, *args, **kwargs)
+
+        with mock.patch.object(mail.EmailMessage, "send", refuse_imran):
+            result = send_statements(self.today, self.today)
+
+        self.assertEqual(result, {"sent": 1, "failed": ["imran"]})
+        self.assertEqual(mail.outbox[0].to, ["ali@example.com"])
+
+        # Retrying the failed usernames only sends their statements
+        result = send_statements(self.today, self.today, ["imran"])
+        self.assertEqual(result, {"sent": 1, "failed": []})
+        self.assertEqual(mail.outbox[1].to, ["imran@example.com"])
+
+    @override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend"
+        )
+    @mock.patch("django.core.mail.backends.smtp.smtplib.SMTP")
+    def test_send_statements_stops_when_reconnect_fails(self, mock_smtp):
+        """
+        Test case for testing that statements left after a failed
+        reconnect are reported as failed instead of raising.
+        """
+        session = mock.Mock()
+        session.sendmail.side_effect = smtplib.SMTPServerDisconnected()
+        mock_smtp.side_effect = [session, ConnectionRefusedError()]
+
+        result = send_statements(self.today, self.today)
+
+        self.assertEqual(result, {"sent": 0, "failed": ["imran", "ali"]})
+        self.assertEqual(mock_smtp.call_count, 2)
+
+    def test_send_statements_defaults_to_previous_month(self):
+        """
+        Test case for testing that the scheduled run covers the previous
+        calendar month.
+        """
+        last_month = timezone.now().replace(day=1) - timedelta(days=1)
+        Order.objects.filter(user=self.users[0]).update(created_at=last_month)
+
+        self.assertEqual(send_statements(), {"sent": 1, "failed": []})
+        self.assertEqual(mail.outbox[0].to, ["imran@example.com"])
+
+    @override_settings(INVOICE_DELIVERY="statement")
+    def test_statement_delivery_sends_no_order_invoices(self):
+        """
+        Test case for testing that statement delivery replaces the
+        per-order invoices.
+        """
+        order = Order.objects.create(user=self.users[0])
+        Items.objects.create(
+            order=order,
+            item_name="Product C",
+            quantity=1,
+            price=Decimal("1.00")
+        )
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertFalse(
+            Artifact.objects.filter(kind=Artifact.INVOICE).exists()
+            )
+
+        send_statements(self.today, self.today)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class AdminTests(TestCase):
+    """
+    Class for testing the admin changelists.
+    """
+    @mock.patch("invoice.signals.enqueue")
+    def setUp(self, mock_enqueue):
+        self.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="admin"
+        )
+        self.user = User.objects.create_user(
+            username="imran", email="imran@example.com", password="imran"
+        )
+        order = Order.objects.create(user=self.user)
+        Items.objects.create(
+            order=order, item_name="Product A", quantity=2,
+            price=Decimal("10.00")
+        )
+        Items.objects.create(
+            order=order, item_name="Product B", quantity=1,
+            price=Decimal("5.00")
+        )
+        self.client.force_login(self.admin)
+
+    def test_order_changelist_annotates_items_and_total(self):
+        """
+        Test case for testing the annotated order changelist.
+        """
+        response = self.client.get("/admin/invoice/order/")
+        self.assertEqual(response.status_code, 200)
+        order = response.context["cl"].result_list[0]
+        self.assertEqual(order.item_count, 2)
+        self.assertEqual(order.total, Decimal("25.00"))
+
+    def test_order_search_by_username_and_email(self):
+        """
+        Test case for testing the order search on the related user.
+        """
+        for query, expected in [
+            ("imr", 1), ("imran@example.com", 1), ("admin", 0)
+        ]:
+            response = self.client.get("/admin/invoice/order/", {"q": query})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context["cl"].result_count, expected)
+
+    @mock.patch("invoice.signals.enqueue")
+    def test_items_changelist_queries_do_not_grow_per_row(self, mock_enqueue):
+        """
+        Test case for testing that item rows do not load users lazily.
+        """
+        url = "/admin/invoice/items/"
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+
+        for i in range(5):
+            order = Order.objects.create(user=self.user)
+            Items.objects.create(
+                order=order, item_name=f"Product {i}", price=Decimal("1.00")
+            )
+        with self.assertNumQueries(len(before)):
+            self.client.get(url)
+
+
+@override_settings(
+    WELCOME_EMAIL_RATE_PER_SECOND=0,
+    WELCOME_EMAIL_BATCH_SIZE=10,
+    WELCOME_EMAIL_MAX_ATTEMPTS=2
+    )
+class WelcomeEmailBufferTests(TestCase):
+    """
+    Class for testing the buffered welcome email pipeline.
+    """
+    def setUp(self):
+        for i in range(3):
+            User.objects.create_user(
+                username=f"user{i}",
+                email=f"user{i}@example.com",
+                password="user"
+            )
+        mail.outbox = []
+
+    def test_flush_sends_batch_over_one_connection(self):
+        """
+        Test case for testing that a flush sends and clears the buffer.
+        """
+        with mock.patch(
+            "invoice.tasks.get_connection", wraps=mail.get_connection
+        ) as mock_connection:
+            result = flush_welcome_emails()
+
+        mock_connection.assert_called_once()
+        self.assertEqual(result, {"sent": 3, "retried": 0, "dropped": 0})
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(PendingWelcomeEmail.objects.exists())
+
+    def test_flush_retries_only_failed_recipients(self):
+        """
+        Test case for testing that only failed recipients are retried.
+        """
+        send = mail.EmailMessage.send
+
+        def fail_for_user1(message, *args, **kwargs):
+            if message.to == ["user1@example.com"]:
+                raise ConnectionError("Recipient refused")
+            return send(message, *args, **kwargs)
+
+        with mock.patch.object(mail.EmailMessage, "send", fail_for_user1):
+            result = flush_welcome_emails()
+        self.assertEqual(result, {"sent": 2, "retried": 1, "dropped": 0})
+
+        pending = PendingWelcomeEmail.objects.get()
+        self.assertEqual(pending.email, "user1@example.com")
+        self.assertEqual(pending.attempts, 1)
+        self.assertGreater(pending.next_attempt_at, timezone.now())
+
+        # The retry is not due yet, then fails for the last allowed time
+        self.assertEqual(flush_welcome_emails()["sent"], 0)
+        pending.next_attempt_at = timezone.now()
+        pending.save()
+        with mock.patch.object(mail.EmailMessage, "send", fail_for_user1):
+            result = flush_welcome_emails()
+        self.assertEqual(result, {"sent": 0, "retried": 0, "dropped": 1})
+        self.assertFalse(PendingWelcomeEmail.objects.exists())
+
+    @override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend"
+        )
+    @mock.patch("django.core.mail.backends.smtp.smtplib.SMTP")
+    def test_flush_keeps_session_after_refused_recipient(self, mock_smtp):
+        """
+        Test case for testing that a refused recipient doesn't make the
+        rest of the batch open their own SMTP sessions.
+        """
+        def refuse_user0(from_addr, to_addrs, message):
+            if to_addrs == ["user0@example.com"]:
+                raise smtplib.SMTPRecipientsRefused({})
+            return {}
+
+        mock_smtp.return_value.sendmail.side_effect = refuse_user0
+        result = flush_welcome_emails()
+
+        self.assertEqual(result, {"sent": 2, "retried": 1, "dropped": 0})
+        mock_smtp.assert_called_once()
+
+    @override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend"
+        )
+    @mock.patch("django.core.mail.backends.smtp.smtplib.SMTP")
+    def test_flush_reconnects_once_after_disconnect(self, mock_smtp):
+        """
+        Test case for testing that a dropped session is replaced by one
+        new session for the rest of the batch.
+        """
+        def disconnect_user0(from_addr, to_addrs, message):
+            if to_addrs == ["user0@example.com"]:
+                raise smtplib.SMTPServerDisconnected()
+            return {}
+
+        mock_smtp.return_value.sendmail.side_effect = disconnect_user0
+        result = flush_welcome_emails()
+
+        self.assertEqual(result, {"sent": 2, "retried": 1, "dropped": 0})
+        self.assertEqual(mock_smtp.call_count, 2)
+
+    @override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend"
+        )
+    @mock.patch("django.core.mail.backends.smtp.smtplib.SMTP")
+    def test_flush_records_results_when_reconnect_fails(self, mock_smtp):
+        """
+        Test case for testing that delivered emails aren't resent and the
+        rest are retried when the relay refuses a new session.
+        """
+        def disconnect_after_user0(from_addr, to_addrs, message):
+            if to_addrs == ["user1@example.com"]:
+                raise smtplib.SMTPServerDisconnected()
+            return {}
+
+        session = mock.Mock()
+        session.sendmail.side_effect = disconnect_after_user0
+        mock_smtp.side_effect = [session, ConnectionRefusedError()]
+
+        result = flush_welcome_emails()
+
+        self.assertEqual(result, {"sent": 1, "retried": 2, "dropped": 0})
+        pending = PendingWelcomeEmail.objects.order_by("email")
+        self.assertEqual(
+            [(p.email, p.attempts) for p in pending],
+            [("user1@example.com", 1), ("user2@example.com", 1)]
+            )
+
+    def test_flush_is_single_flight(self):
+        """
+        Test case for testing that a flush started while another one is
+        sending does nothing.
+        """
+        with single_flight(flush_welcome_emails.name, timedelta(minutes=1)):
+            result = flush_welcome_emails()
+        self.assertEqual(result, {"sent": 0, "retried": 0, "dropped": 0})
+        self.assertEqual(PendingWelcomeEmail.objects.count(), 3)
+
+        # Released once the running flush is done
+        self.assertEqual(flush_welcome_emails()["sent"], 3)
+
+    def test_expired_lock_can_be_taken(self):
+        """
+        Test case for testing that a crashed holder's lock expires.
+        """
+        self.assertIsNotNone(acquire_lock("flush", timedelta(minutes=1)))
+        self.assertIsNone(acquire_lock("flush", timedelta(minutes=1)))
+        TaskLock.objects.update(locked_until=timezone.now())
+        self.assertIsNotNone(acquire_lock("flush", timedelta(minutes=1)))
+
+    @mock.patch("invoice.ratelimit.time")
+    def test_rate_limiter_paces_calls(self, mock_time):
+        """
+        Test case for testing that the rate limiter spaces out calls.
+        """
+        mock_time.monotonic.return_value = 100.0
+        limiter = RateLimiter(4)
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual(
+            [c.args[0] for c in mock_time.sleep.call_args_list],
+            [0.25, 0.5]
+        )
+
+
+class ImportTimeTests(TestCase):
+    """
+    Class for testing that sending tasks doesn't load heavy dependencies.
+    """
+    def test_signals_do_not_import_rendering_dependencies(self):
+        """
+        Test case for testing that the web process stays free of
+        ReportLab, PIL and requests.
+        """
+        code = (
+            "import os, sys, django;"
+            "os.environ['DJANGO_SETTINGS_MODULE'] = 'pdf_invoice.settings';"
+            "django.setup();"
+            "import invoice.signals;"
+            "print(sorted(m for m in ('reportlab', 'PIL', 'requests',"
+            " 'invoice.tasks') if m in sys.modules))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        self.assertEqual(output.strip(), "[]")
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class LoadgenTests(TestCase):
+    """
+    Class for testing the load generation command.
+    """
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_loadgen_eager_run_reports_latency_and_cleans_up(self):
+        """
+        Test case for testing a short eager load generation run.
+        """
+        out = io.StringIO()
+        media_root = settings.MEDIA_ROOT
+        call_command(
+            "loadgen", executor="eager", rates="50", duration=0.2,
+            mix="order=1", items=2, stdout=out
+        )
+        output = out.getvalue()
+        self.assertIn("invoices/s delivered, p50", output)
+        self.assertIn("No saturation", output)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Artifact.objects.exists())
+        # Synthetic tasks aren't counted, and the run's overrides are undone
+        self.assertFalse(TaskOutcome.objects.exists())
+        self.assertEqual(settings.MEDIA_ROOT, media_root)
+        send_welcome_email.apply(args=["imran@example.com"])
+        self.assertEqual(TaskOutcome.objects.get().count, 1)
+
+
+class CanvasRendererTests(TestCase):
+    """
+    Class for testing the canvas invoice renderer.
+    """
+    def make_invoice(self, items):
+        rows = [
+            (f"Product {n}", n % 5 + 1, Decimal("10.00"),
+             Decimal("10.00") * (n % 5 + 1))
+            for n in range(items)
+        ]
+        return {
+            "order_id": 42,
+            "customer": "imran",
+            "items": rows,
+            "total": sum(total for *_, total in rows),
+        }
+
+    def page_count(self, pdf):
+        return len(re.findall(rb"/Type /Page\b(?!s)", pdf))
+
+    def text(self, pdf):
+        """
+        Returns the strings drawn on the pages of a ReportLab PDF, in
+        drawing order.
+        """
+        strings = []
+        for stream in re.findall(
+            rb"/ASCII85Decode /FlateDecode \][^>]*>>\s*stream\r?\n(.*?)~>",
+            pdf,
+            re.S
+        ):
+            content = zlib.decompress(base64.a85decode(stream.strip()))
+            strings += re.findall(rb"\((.*?)\) Tj", content)
+        return [string.decode() for string in strings]
+
+    def test_canvas_paginates_like_platypus(self):
+        """
+        Test case for testing that both renderers need the same pages.
+        """
+        for items in [1, 5, 100]:
+            data = self.make_invoice(items)
+            canvas_pdf = render_invoice_canvas(data)
+            self.assertTrue(canvas_pdf.startswith(b"%PDF"))
+            self.assertEqual(
+                self.page_count(canvas_pdf),
+                self.page_count(render_invoice(data))
+            )
+
+    def test_canvas_draws_the_same_text_as_platypus(self):
+        """
+        Test case for testing that both renderers show the same customer,
+        order id, item rows and total.
+        """
+        for items in [1, 100]:
+            data = self.make_invoice(items)
+            canvas_text = self.text(render_invoice_canvas(data))
+            self.assertEqual(canvas_text, self.text(render_invoice(data)))
+
+            self.assertIn("Customer: imran", canvas_text)
+            self.assertIn("Order ID: 42", canvas_text)
+            self.assertIn(f"Product {items - 1}", canvas_text)
+            self.assertEqual(
+                canvas_text[-3:],
+                ["Total Amount", f"${data['total']}",
+                 "Thank you for your purchase!"]
+            )
+
+    @override_settings(INVOICE_TEMPLATE="canvas")
+    def test_get_renderer_uses_template_setting(self):
+        """
+        Test case for testing the renderer selection.
+        """
+        self.assertIs(get_renderer(), render_invoice_canvas)
+        self.assertIs(get_renderer("platypus"), render_invoice)
+        with self.assertRaises(ValueError):
+            get_renderer("unknown")
@@ -77,12 +77,56 @@ WSGI_APPLICATION = "pdf_invoice.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DATABASE_PROFILE selects the backend shared by web, worker and beat:
+# - "sqlite": WAL journal, busy timeout and relaxed fsync so concurrent
+#   writers wait for the lock instead of failing with "database is locked".
+# - "postgres": persistent connections (CONN_MAX_AGE) or, with
+#   POSTGRES_POOL=1, a psycopg connection pool.
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "sqlite")
+
+if DATABASE_PROFILE == "postgres":
+    POSTGRES_POOL = os.getenv("POSTGRES_POOL", "0") == "1"
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("POSTGRES_DB", "pdf_invoice"),
+            "USER": os.getenv("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+            "HOST": os.getenv("POSTGRES_HOST", "localhost"),
+            "PORT": os.getenv("POSTGRES_PORT", "5432"),
+            # Pooled connections are returned to the pool after each
+            # request, so persistent connections only apply without it.
+            "CONN_MAX_AGE": 0 if POSTGRES_POOL else int(
+                os.getenv("CONN_MAX_AGE", 600)
+                ),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "pool": {
+                    "min_size": int(os.getenv("POSTGRES_POOL_MIN_SIZE", 2)),
+                    "max_size": int(os.getenv("POSTGRES_POOL_MAX_SIZE", 10)),
+                } if POSTGRES_POOL else False,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "OPTIONS": {
+                # Seconds a writer waits for the lock before giving up
+                "timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 20)),
+                # Take the write lock at BEGIN so transactions queue on the
+                # busy timeout instead of deadlocking on lock upgrade.
+                "transaction_mode": "IMMEDIATE",
+                "init_command": (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    "PRAGMA temp_store=MEMORY;"
+                ),
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -133,16 +177,63 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True  # helpful when containers start in parallel
 
+# Results are only stored for tasks that opt in with ignore_result=False.
+CELERY_TASK_IGNORE_RESULT = True
+# Disable celery's built-in backend_cleanup, prune_task_results deletes
+# in batches
+CELERY_RESULT_EXPIRES = None
+CELERY_RESULT_RETENTION_DAYS = int(
+    os.getenv("CELERY_RESULT_RETENTION_DAYS", 7)
+    )
+CELERY_RESULT_PRUNE_BATCH_SIZE = int(
+    os.getenv("CELERY_RESULT_PRUNE_BATCH_SIZE", 1000)
+    )
+
 # Celery Beat (you already have this)
 CELERY_BEAT_SCHEDULE = {
     'send-daily-email-at-9am': {
         'task': 'invoice.tasks.send_daily_summary',
         'schedule': crontab(hour=9, minute=0),
     },
+    'prune-task-results-hourly': {
+        'task': 'invoice.tasks.prune_task_results',
+        'schedule': crontab(minute=30),
+    },
+    'flush-welcome-emails': {
+        'task': 'invoice.tasks.flush_welcome_emails',
+        'schedule': 10.0,
+    },
+    'pack-invoice-archives-monthly': {
+        'task': 'invoice.tasks.pack_invoice_archives',
+        'schedule': crontab(day_of_month=1, hour=3, minute=0),
+    },
 }
 
 # Media
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Invoices older than this are packed into monthly zip archives
+INVOICE_ARCHIVE_AFTER_DAYS = int(os.getenv("INVOICE_ARCHIVE_AFTER_DAYS", 90))
+# Invoice renderer: "platypus" (flowable layout) or "canvas" (fixed layout
+# drawn directly, faster)
+INVOICE_TEMPLATE = os.getenv("INVOICE_TEMPLATE", "platypus")
+# Invoice delivery: "invoice" emails one invoice per order as items are
+# added, "statement" sends each user one statement per calendar month
+INVOICE_DELIVERY = os.getenv("INVOICE_DELIVERY", "invoice")
+if INVOICE_DELIVERY == "statement":
+    CELERY_BEAT_SCHEDULE['send-statements-monthly'] = {
+        'task': 'invoice.tasks.send_statements',
+        'schedule': crontab(day_of_month=1, hour=4, minute=0),
+    }
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Welcome emails are buffered and flushed every 10 seconds, one flush at a
+# time, so the relay never sees more than WELCOME_EMAIL_RATE_PER_SECOND.
+WELCOME_EMAIL_RATE_PER_SECOND = float(
+    os.getenv("WELCOME_EMAIL_RATE_PER_SECOND", 10)
+    )
+WELCOME_EMAIL_BATCH_SIZE = int(os.getenv("WELCOME_EMAIL_BATCH_SIZE", 100))
+WELCOME_EMAIL_MAX_ATTEMPTS = 5
+# Seconds before the first retry of a failed recipient, doubled per attempt
+WELCOME_EMAIL_RETRY_DELAY = 10